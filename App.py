@@ -1,8 +1,16 @@
+import html
 import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+import pandas as pd
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
 
 # -----------------------
 # CONFIG (from Streamlit secrets)
@@ -16,8 +24,6 @@ except Exception as e:
     st.error("Missing secrets. Please set APP_USER, APP_PASS, TWILIO_SID, TWILIO_AUTH_TOKEN in Streamlit Secrets.")
     st.stop()
 
-client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-
 # -----------------------
 # NAME MAP
 # -----------------------
@@ -31,47 +37,304 @@ NAME_MAP = {
 }
 
 MIN_MESSAGES_FOR_CAMPAIGN = 10
+# Display caps for the "Other SMS" section (per user / per message body)
+MAX_OTHER_SMS_PER_USER = 200
+MAX_OTHER_SMS_BODY_CHARS = 200
 
 # -----------------------
 # Helpers
 # -----------------------
+_NON_PHONE_RE = re.compile(r"[^0-9+]")
+_PHONE_TAIL_RE = re.compile(r"(\+?\d{5,15})$")
+
+# Our numbers and regular contacts recur across columns and reruns
+@lru_cache(maxsize=4096)
 def normalize_number(val):
     if not val:
         return None
     s = str(val).strip()
+    # Fast path: Twilio already hands back E.164 ("+" and 5-15 digits)
+    digits = s[1:]
+    if s.startswith("+") and 5 <= len(digits) <= 15 and digits.isascii() and digits.isdigit():
+        return s
     # Keep only + and digits
-    s = re.sub(r"[^0-9+]", "", s)
+    s = _NON_PHONE_RE.sub("", s)
     # Extract last 15 digits optionally with +
-    m = re.search(r'(\+?\d{5,15})$', s)
+    m = _PHONE_TAIL_RE.search(s)
     if m:
         num = m.group(1)
         return num if num.startswith("+") else "+" + num
     return None
 
+def normalize_numbers(values):
+    """Column-wise normalize_number: returns a string Series with <NA> where no number is found."""
+    # The same few numbers repeat across thousands of records, so normalize
+    # each distinct value once and map the results back
+    normalized = {val: normalize_number(val) for val in values.unique()}
+    return values.map(normalized).astype("string")
+
+# Bulk campaigns repeat the same body hundreds of times; cache on the full body
+@lru_cache(maxsize=4096)
 def extract_template(body):
-    if not body:
+    # A template needs a comma plus more than 30 characters after it
+    if not body or len(body) < 32:
         return None
-    parts = body.split(',', 1)
-    if len(parts) > 1:
-        template = parts[1].strip()
+    # Locate the comma without slicing, so a short tail is rejected before
+    # any copy is made
+    comma = body.find(',')
+    if comma >= 0 and len(body) - comma - 1 > 30:
+        template = body[comma + 1:].strip()
         if len(template) > 30:
-            return template
+            # Personalised bodies ("Hi Bob, ...", "Hi Ann, ...") yield equal
+            # templates; intern them so the report holds one copy of each
+            return sys.intern(template)
     return None
 
-NORMALIZED_NAME_MAP = {normalize_number(k): v for k, v in NAME_MAP.items() if normalize_number(k)}
+# Twilio's direction values are a closed set, so classify them with one lookup
+_DIRECTIONS = {
+    "inbound": "inbound",
+    "outbound": "outbound",
+    "outbound-api": "outbound",
+    "outbound-call": "outbound",
+    "outbound-dial": "outbound",
+    "outbound-reply": "outbound",
+}
+
+def _direction_kind(direction):
+    direction = direction.lower()
+    kind = _DIRECTIONS.get(direction)
+    if kind is None:
+        # Not a documented value: fall back to a substring check
+        kind = "outbound" if "outbound" in direction else "inbound" if "inbound" in direction else ""
+    return kind
+
+def direction_kinds(directions):
+    """Column-wise _direction_kind: "outbound", "inbound", or "" when missing/unknown."""
+    directions = directions.fillna("")
+    return directions.map({d: _direction_kind(d) for d in directions.unique()})
+
+# Read-only: cached fetches and reports are derived from it
+NORMALIZED_NAME_MAP = MappingProxyType({num: v for k, v in NAME_MAP.items() if (num := normalize_number(k))})
+# Membership-only view of our numbers; the mapping is kept for name lookups
+OUR_NUMBERS = frozenset(NORMALIZED_NAME_MAP)
 
-def our_number_from_message(m):
-    direction = (getattr(m, "direction", "") or "").lower()
-    if direction.startswith("outbound"):
-        return normalize_number(getattr(m, "from_", None))
-    elif direction.startswith("inbound"):
-        return normalize_number(getattr(m, "to", None))
-    # Fallback
-    return normalize_number(getattr(m, "from_", None) or getattr(m, "to", None))
+# -----------------------
+# Cached Twilio fetches
+# -----------------------
+# Twilio resource objects don't pickle cleanly, so each fetch streams the
+# paginator and projects every record to a plain dict holding only the fields
+# the report reads, without buffering the full resource objects first. The
+# account SID is part of the cache key so two accounts never share an entry.
+#
+# Rather than pulling the whole account's traffic and discarding everything
+# that isn't ours, Twilio filters server-side: one query per (from_/to, our
+# number), run concurrently and merged by SID so calls/texts between two of
+# our numbers are only counted once. Twilio matches these filters exactly, so
+# messages are also queried in the whatsapp: form; other addressed forms
+# (sip:..., client:...) aren't fetched. The limit applies per query; each fetch
+# also reports whether any query hit it, so a truncated window isn't silent,
+# and when it was pulled, so anything derived from it can expire with it.
+TWILIO_CACHE_TTL = 300  # seconds
+TWILIO_PAGE_SIZE = 1000  # Twilio's maximum records per page
+# Concurrent queries per fetch; bounded so a growing NAME_MAP can't trip
+# Twilio's concurrency limit (HTTP 429)
+TWILIO_MAX_WORKERS = 8
+
+CALL_NUMBER_PREFIXES = ("",)
+MESSAGE_NUMBER_PREFIXES = ("", "whatsapp:")
+
+# Enough keep-alive connections for every concurrent query: calls and messages
+# are fetched at once, each running up to TWILIO_MAX_WORKERS of its queries
+TWILIO_MAX_CONNECTIONS = max(1, sum(
+    min(TWILIO_MAX_WORKERS, 2 * len(prefixes) * len(NORMALIZED_NAME_MAP))
+    for prefixes in (CALL_NUMBER_PREFIXES, MESSAGE_NUMBER_PREFIXES)
+))
+
+# Streamlit reruns this script on every interaction; keep one client per
+# account for the whole server process instead of rebuilding it each time
+@st.cache_resource
+def get_client(account_sid, auth_token, pool_size):
+    # twilio-python already shares one requests Session, but its default pool
+    # (cpu_count + 4) is smaller than our fan-out, and connections beyond it
+    # are dropped after each page instead of being reused
+    http_client = TwilioHttpClient()
+    http_client.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return Client(account_sid, auth_token, http_client=http_client)
+
+client = get_client(TWILIO_SID, TWILIO_AUTH_TOKEN, TWILIO_MAX_CONNECTIONS)
+
+CALL_FIELDS = ("sid", "from_", "to", "direction", "status", "duration", "parent_call_sid", "start_time", "end_time")
+MESSAGE_FIELDS = ("sid", "from_", "to", "direction", "status", "body", "date_sent")
+
+_NO_TIME = datetime.min.replace(tzinfo=timezone.utc)
+
+# Fields a resource may expose under another name: twilio 9.x keeps a call's
+# caller in `_from` (MessageInstance still has `from_`)
+_FIELD_FALLBACKS = {"from_": "_from"}
+
+def _read_field(resource, field):
+    value = getattr(resource, field, None)
+    if value is None and field in _FIELD_FALLBACKS:
+        value = getattr(resource, _FIELD_FALLBACKS[field], None)
+    return value
+
+def _fetch_ours(stream, fields, time_field, prefixes, limit, **window):
+    queries = [
+        {side: prefix + num}
+        for num in NORMALIZED_NAME_MAP for prefix in prefixes for side in ("from_", "to")
+    ]
+    if not queries:
+        return [], False, time.monotonic()
+
+    def fetch(query):
+        # Not every field exists on every resource or helper-library version,
+        # so read each with a default rather than failing the whole fetch
+        return [
+            {f: _read_field(r, f) for f in fields}
+            for r in stream(**window, **query, limit=limit, page_size=TWILIO_PAGE_SIZE)
+        ]
+
+    records = {}
+    truncated = False
+    with ThreadPoolExecutor(max_workers=min(len(queries), TWILIO_MAX_WORKERS)) as pool:
+        for batch in pool.map(fetch, queries):
+            truncated = truncated or len(batch) >= limit
+            for rec in batch:
+                records.setdefault(rec["sid"], rec)
+    # Newest first, matching a single unfiltered query
+    records = sorted(records.values(), key=lambda rec: rec[time_field] or _NO_TIME, reverse=True)
+    return records, truncated, time.monotonic()
+
+@st.cache_data(ttl=TWILIO_CACHE_TTL, show_spinner=False)
+def _fetch_calls(account_sid, start_utc, end_utc, limit):
+    return _fetch_ours(client.calls.stream, CALL_FIELDS, "start_time", CALL_NUMBER_PREFIXES, limit, start_time_after=start_utc, start_time_before=end_utc)
+
+@st.cache_data(ttl=TWILIO_CACHE_TTL, show_spinner=False)
+def _fetch_messages(account_sid, start_utc, end_utc, limit):
+    return _fetch_ours(client.messages.stream, MESSAGE_FIELDS, "date_sent", MESSAGE_NUMBER_PREFIXES, limit, date_sent_after=start_utc, date_sent_before=end_utc)
+
+# ---------------------------------
+# Report Aggregation
+# ---------------------------------
+def build_report(calls, messages):
+    """
+    Aggregates fetched call/message records into render-ready structures.
+    """
+    # --- FIXED CALL PROCESSING: Use Twilio's direction field ---
+    calls_df = pd.DataFrame(calls, columns=CALL_FIELDS)
+    status = calls_df["status"].fillna("").str.lower()
+    # Skip child calls (e.g., conference legs) and anything that didn't complete
+    completed = calls_df[calls_df["parent_call_sid"].isna() & (status == "completed")]
+
+    duration = pd.to_numeric(completed["duration"], errors="coerce").fillna(0).astype(int)
+    from_num = normalize_numbers(completed["from_"])
+    to_num = normalize_numbers(completed["to"])
+    direction = direction_kinds(completed["direction"])
+
+    # For outbound calls our number must be the 'from', for inbound the 'to'.
+    # If direction is missing/unknown, fall back to whichever side is ours.
+    is_out_dir = direction == "outbound"
+    is_in_dir = direction == "inbound"
+    unknown_dir = direction == ""
+    from_ours = from_num.isin(OUR_NUMBERS)
+    to_ours = to_num.isin(OUR_NUMBERS)
+    outbound = from_ours & (is_out_dir | unknown_dir)
+    inbound = to_ours & (is_in_dir | (unknown_dir & ~from_ours))
+
+    # Unsorted: the summary below reindexes onto NAME_MAP order anyway
+    outbound_stats = duration[outbound].groupby(from_num[outbound], sort=False).agg(outbound_calls="size", outbound_duration="sum")
+    inbound_stats = duration[inbound].groupby(to_num[inbound], sort=False).agg(inbound_calls="size", inbound_duration="sum")
+
+    # --- SMS PROCESSING ---
+    msgs_df = pd.DataFrame(messages, columns=MESSAGE_FIELDS)
+    msg_direction = direction_kinds(msgs_df["direction"])
+    msg_from = normalize_numbers(msgs_df["from_"])
+    msg_to = normalize_numbers(msgs_df["to"])
+    msg_outbound = msg_direction == "outbound"
+    # Our side is 'from' for outbound, 'to' for inbound, else whichever is set
+    fallback = normalize_numbers(msgs_df["from_"].where(msgs_df["from_"].fillna("") != "", msgs_df["to"]))
+    our_num = msg_from.where(
+        msg_outbound,
+        msg_to.where(msg_direction == "inbound", fallback),
+    )
+    mine = our_num.isin(OUR_NUMBERS)
+    our_num = our_num[mine]
+    is_outbound = msg_outbound[mine]
+    body = msgs_df.loc[mine, "body"].fillna("")
+
+    sms_counts = our_num.value_counts().rename("sms")
+
+    templates = body[is_outbound].map(extract_template)
+    templates = templates[templates.notna()]
+    campaign_counts = templates.groupby(our_num[templates.index], sort=False).value_counts(sort=False)
+    # Only bulk sends count as campaigns; biggest first within each user
+    campaigns_df = (
+        campaign_counts[campaign_counts >= MIN_MESSAGES_FOR_CAMPAIGN]
+        .rename_axis(["num", "template"])
+        .rename("count")
+        .sort_values(ascending=False, kind="stable")
+        .reset_index()
+    )
+    # Expander labels, built once with the report rather than on every render
+    campaigns_df["preview"] = campaigns_df["template"].str.slice(0, 80).str.strip()
+
+    is_other = ~body.index.isin(templates.index)
+    other_df = pd.DataFrame({
+        "num": our_num[is_other],
+        "direction": is_outbound[is_other].map({True: "outbound", False: "inbound"}),
+        "contact": msg_to[mine].where(is_outbound, msg_from[mine])[is_other].astype(object),
+        "body": body[is_other],
+    })
+    other_df["contact"] = other_df["contact"].where(other_df["contact"].notna(), None)
+    # Keep the true per-user totals, but only hold on to what gets displayed
+    other_counts = other_df["num"].value_counts()
+    other_df = other_df.groupby("num", sort=False).head(MAX_OTHER_SMS_PER_USER)
+    other_df["body"] = other_df["body"].str.slice(0, MAX_OTHER_SMS_BODY_CHARS)
+
+    # Build the summary table: one dense column per metric over every user in
+    # NAME_MAP order, then drop users with no activity in the window
+    summary = pd.DataFrame({
+        "inbound_calls": inbound_stats["inbound_calls"],
+        "inbound_duration": inbound_stats["inbound_duration"],
+        "outbound_calls": outbound_stats["outbound_calls"],
+        "outbound_duration": outbound_stats["outbound_duration"],
+        "sms": sms_counts,
+    }, index=pd.Index(NORMALIZED_NAME_MAP)).fillna(0).astype(int)
+    summary = summary[summary.any(axis=1)]
+    report_df = pd.DataFrame({
+        "Name": summary.index.map(NORMALIZED_NAME_MAP),
+        "Number": summary.index,
+        "Inbound Calls": summary["inbound_calls"],
+        "Inbound Mins": (summary["inbound_duration"] / 60).map(lambda mins: round(mins, 1)),
+        "Outbound Calls": summary["outbound_calls"],
+        "Outbound Mins": (summary["outbound_duration"] / 60).map(lambda mins: round(mins, 1)),
+        "SMS": summary["sms"],
+        "Total Activity": summary["inbound_calls"] + summary["outbound_calls"] + summary["sms"],
+    })
+    report_df = report_df.sort_values("Total Activity", ascending=False, kind="stable", ignore_index=True)
+
+    return {
+        "report_df": report_df,
+        "campaigns_df": campaigns_df,
+        "other_df": other_df,
+        "other_counts": other_counts,
+        "calls_debug": pd.DataFrame({"from": from_num, "to": to_num, "dir": direction, "dur": duration, "status": status[completed.index]}),
+        "num_calls": len(calls),
+        "num_messages": len(messages),
+        "call_samples": calls[:10],
+        "message_samples": messages[:10],
+    }
 
 # ---------------------------------
 # Main Report Function
 # ---------------------------------
+def _html_text(text):
+    # Escaped for raw HTML; newlines as entities so a blank line in an SMS
+    # can't end the HTML block and drop the rest back into markdown. CommonMark
+    # treats a bare \r as a line ending too, so fold every form into \n first.
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return html.escape(text).replace("\n", "&#10;")
+
 def run_report(start_utc, end_utc, show_raw):
     """
     Fetches Twilio data and displays a report with separate inbound/outbound stats.
@@ -81,169 +344,96 @@ def run_report(start_utc, end_utc, show_raw):
 
     st.markdown(f"**Report Window (IST):** {start_ist_display.strftime('%d-%b-%Y %I:%M %p')} → {end_ist_display.strftime('%d-%b-%Y %I:%M %p')}")
 
-    with st.spinner('Fetching data from Twilio...'):
-        report_data = defaultdict(lambda: {
-            "inbound_calls": 0, "inbound_duration": 0,
-            "outbound_calls": 0, "outbound_duration": 0,
-            "sms": 0,
-            "campaigns": defaultdict(int), "other_sms": []
-        })
-        try:
-            fetch_limit = 20000 if (end_utc - start_utc).days > 2 else 5000
-            calls = list(client.calls.list(start_time_after=start_utc, start_time_before=end_utc, limit=fetch_limit))
-            messages = list(client.messages.list(date_sent_after=start_utc, date_sent_before=end_utc, limit=fetch_limit))
-        except Exception as e:
-            st.error(f"Error fetching from Twilio: {e}")
-            st.stop()
-
-    st.success(f"Fetched {len(calls)} calls and {len(messages)} messages.")
+    # Widget interactions rerun the script; reuse the report built for this
+    # window until the fetch cache would have expired anyway. The fetch cache
+    # is shared across sessions, so age the report from when its data was
+    # pulled, not from when this session built it.
+    cache_key = (start_utc.isoformat(), end_utc.isoformat())
+    cached = st.session_state.get("report_cache", {}).get(cache_key)
+    if cached is not None and time.monotonic() - cached["fetched_at"] < TWILIO_CACHE_TTL:
+        report = cached["report"]
+    else:
+        with st.spinner('Fetching data from Twilio...'):
+            try:
+                fetch_limit = 20000 if (end_utc - start_utc).days > 2 else 5000
+                # Both fetches are independent and network-bound, so overlap them
+                with ThreadPoolExecutor(max_workers=2) as ex:
+                    calls_future = ex.submit(_fetch_calls, TWILIO_SID, start_utc, end_utc, fetch_limit)
+                    messages_future = ex.submit(_fetch_messages, TWILIO_SID, start_utc, end_utc, fetch_limit)
+                    calls, calls_truncated, calls_fetched_at = calls_future.result()
+                    messages, messages_truncated, messages_fetched_at = messages_future.result()
+            except Exception as e:
+                st.error(f"Error fetching from Twilio: {e}")
+                st.stop()
+
+        report = build_report(calls, messages)
+        report["truncated_at"] = fetch_limit if calls_truncated or messages_truncated else None
+        st.session_state["report_cache"] = {cache_key: {"report": report, "fetched_at": min(calls_fetched_at, messages_fetched_at)}}
+
+    st.success(f"Fetched {report['num_calls']} calls and {report['num_messages']} messages involving our numbers.")
+    st.caption("Only records sent from or to a NAME_MAP number (or its whatsapp: form for SMS) are fetched; SIP and client-addressed legs aren't included.")
+    if report["truncated_at"]:
+        st.warning(f"At least one number hit the {report['truncated_at']:,}-record fetch limit; totals for this window may be incomplete.")
 
     if show_raw:
         with st.expander("Show Raw Data Samples"):
             st.subheader("Sample Messages (first 10)")
-            for m in messages[:10]:
-                st.json({
-                    "sid": getattr(m, 'sid', None),
-                    "from": getattr(m, 'from_', None),
-                    "to": getattr(m, 'to', None),
-                    "direction": getattr(m, 'direction', None),
-                    "status": getattr(m, 'status', None),
-                    "body": getattr(m, 'body', None)
-                })
+            st.dataframe(pd.DataFrame(report["message_samples"], columns=MESSAGE_FIELDS).rename(columns={"from_": "from"}), hide_index=True)
             st.subheader("Sample Calls (first 10)")
-            for c in calls[:10]:
-                st.json({
-                    "sid": getattr(c, 'sid', None),
-                    "from": getattr(c, 'from_', None),
-                    "to": getattr(c, 'to', None),
-                    "direction": getattr(c, 'direction', None),
-                    "status": getattr(c, 'status', None),
-                    "duration": getattr(c, 'duration', None),
-                    "parent_call_sid": getattr(c, 'parent_call_sid', None),
-                    "start_time": str(getattr(c, 'start_time', None)),
-                    "end_time": str(getattr(c, 'end_time', None))
-                })
-
-    # --- FIXED CALL PROCESSING: Use Twilio's direction field ---
-    completed_calls = 0
-    for c in calls:
-        # Skip child calls (e.g., conference legs)
-        if getattr(c, 'parent_call_sid', None) is not None:
-            continue
-
-        status = (getattr(c, "status", "") or "").lower()
-        if status != "completed":
-            continue
-
-        completed_calls += 1
-        duration = int(getattr(c, "duration", 0) or 0)
-        from_num = normalize_number(getattr(c, 'from_', None))
-        to_num = normalize_number(getattr(c, 'to', None))
-        direction = (getattr(c, "direction", "") or "").lower()
-
-        if show_raw:
-            st.write(f"DEBUG CALL: from={from_num} to={to_num} dir={direction} dur={duration} status={status}")
-
-        if 'outbound' in direction:
-            # For outbound calls, our number must be the 'from'
-            if from_num in NORMALIZED_NAME_MAP:
-                report_data[from_num]["outbound_calls"] += 1
-                report_data[from_num]["outbound_duration"] += duration
-        elif 'inbound' in direction:
-            # For inbound calls, our number must be the 'to'
-            if to_num in NORMALIZED_NAME_MAP:
-                report_data[to_num]["inbound_calls"] += 1
-                report_data[to_num]["inbound_duration"] += duration
-        else:
-            # Fallback if direction is missing/unknown
-            if from_num in NORMALIZED_NAME_MAP:
-                report_data[from_num]["outbound_calls"] += 1
-                report_data[from_num]["outbound_duration"] += duration
-            elif to_num in NORMALIZED_NAME_MAP:
-                report_data[to_num]["inbound_calls"] += 1
-                report_data[to_num]["inbound_duration"] += duration
-
-    if show_raw:
-        st.info(f"DEBUG: Completed calls counted: {completed_calls}")
-
-    # --- SMS PROCESSING (kept as-is with slight hardening) ---
-    for m in messages:
-        num = our_number_from_message(m)
-        if not num or num not in NORMALIZED_NAME_MAP:
-            continue
-
-        report_data[num]["sms"] += 1
-        direction = (getattr(m, "direction", "") or "").lower()
-        body = getattr(m, 'body', '') or ''
-        is_campaign = False
-
-        if 'outbound' in direction and (template := extract_template(body)):
-            report_data[num]["campaigns"][template] += 1
-            is_campaign = True
-
-        if not is_campaign:
-            contact = getattr(m, 'to', None) if 'outbound' in direction else getattr(m, 'from_', None)
-            contact = normalize_number(contact)
-            report_data[num]["other_sms"].append({
-                "direction": "outbound" if 'outbound' in direction else "inbound",
-                "contact": contact,
-                "body": body
-            })
-
-    # Build and display report
-    rows = []
-    for num, stats in report_data.items():
-        rows.append({
-            "Name": NORMALIZED_NAME_MAP.get(num, "Unknown"),
-            "Number": num,
-            "Inbound Calls": stats["inbound_calls"],
-            "Inbound Mins": round(stats["inbound_duration"] / 60, 1),
-            "Outbound Calls": stats["outbound_calls"],
-            "Outbound Mins": round(stats["outbound_duration"] / 60, 1),
-            "SMS": stats["sms"],
-            "Total Activity": stats["inbound_calls"] + stats["outbound_calls"] + stats["sms"],
-        })
-    if not rows:
+            st.dataframe(pd.DataFrame(report["call_samples"], columns=CALL_FIELDS).rename(columns={"from_": "from"}), hide_index=True)
+        st.write("DEBUG CALLS:")
+        st.dataframe(report["calls_debug"], hide_index=True)
+        st.info(f"DEBUG: Completed calls counted: {len(report['calls_debug'])}")
+
+    report_df = report["report_df"]
+    campaigns_df = report["campaigns_df"]
+    other_df = report["other_df"]
+    if report_df.empty:
         st.info("No activity found for the specified users in this time window.")
         return
 
-    rows = sorted(rows, key=lambda r: r["Total Activity"], reverse=True)
+    users = list(zip(report_df["Number"], report_df["Name"]))
     st.subheader("📊 Summary Report")
-    st.dataframe(rows, hide_index=True)
+    st.dataframe(report_df, hide_index=True)
     st.caption("Displaying report only for users defined in NAME_MAP.")
 
     st.divider()
     st.subheader("📢 Bulk SMS Campaign Details")
-    found_campaigns = any(
-        report_data[row['Number']]['campaigns']
-        for row in rows
-        if any(c >= MIN_MESSAGES_FOR_CAMPAIGN for c in report_data[row['Number']]['campaigns'].values())
-    )
-    if not found_campaigns:
+    if campaigns_df.empty:
         st.info(f"No bulk campaigns with {MIN_MESSAGES_FOR_CAMPAIGN} or more messages were detected.")
     else:
-        for row in rows:
-            user_campaigns = {k: v for k, v in report_data[row['Number']]['campaigns'].items() if v >= MIN_MESSAGES_FOR_CAMPAIGN}
-            if user_campaigns:
-                st.markdown(f"**Campaigns for {row['Name']} ({row['Number']})**")
-                sorted_campaigns = sorted(user_campaigns.items(), key=lambda i: i[1], reverse=True)
-                for idx, (template, count) in enumerate(sorted_campaigns):
-                    with st.expander(f"**{count} Msgs:** `{template[:80].strip()}...`"):
-                        st.text_area("Full Template", template, height=150, disabled=True, key=f"camp_{row['Number']}_{idx}")
+        campaigns_by_num = dict(tuple(campaigns_df.groupby("num", sort=False)))
+        for num, name in users:
+            user_campaigns = campaigns_by_num.get(num)
+            if user_campaigns is not None:
+                st.markdown(f"**Campaigns for {name} ({num})**")
+                # One element per user: native <details> collapse in the browser
+                # instead of an expander + code block per campaign
+                st.markdown("".join(
+                    f"<details><summary><b>{count} Msgs:</b> <code>{_html_text(preview)}...</code></summary>"
+                    f"<pre style='white-space: pre-wrap'>{_html_text(template)}</pre></details>"
+                    for template, count, preview in zip(user_campaigns["template"], user_campaigns["count"], user_campaigns["preview"])
+                ), unsafe_allow_html=True)
 
     st.divider()
     st.subheader("📬 Other SMS (Replies & Individual Messages)")
-    found_other = any(report_data[row['Number']]['other_sms'] for row in rows)
-    if not found_other:
+    if other_df.empty:
         st.info("No individual or reply SMS were detected.")
     else:
-        for row in rows:
-            other_msgs = report_data[row['Number']]['other_sms']
-            if other_msgs:
-                with st.expander(f"**{row['Name']}** has **{len(other_msgs)}** other messages"):
-                    for msg in other_msgs:
-                        contact = msg['contact'] or 'Unknown'
-                        st.markdown(f"{'▶️ **To**' if msg['direction'] == 'outbound' else '◀️ **From**'} `{contact}`: _{msg['body']}_")
+        other_by_num = dict(tuple(other_df.groupby("num", sort=False)))
+        for num, name in users:
+            other_msgs = other_by_num.get(num)
+            if other_msgs is not None:
+                total = report["other_counts"][num]
+                with st.expander(f"**{name}** has **{total}** other messages"):
+                    # One table per user instead of a markdown element per message
+                    st.dataframe(pd.DataFrame({
+                        "Direction": other_msgs["direction"].map({"outbound": "▶️ To", "inbound": "◀️ From"}),
+                        "Contact": other_msgs["contact"].fillna("Unknown"),
+                        "Message": other_msgs["body"],
+                    }), hide_index=True, width="stretch")
+                    if total > len(other_msgs):
+                        st.caption(f"…plus {total - len(other_msgs)} more messages not shown")
 
 # -----------------------
 # STREAMLIT UI
@@ -266,12 +456,40 @@ if "start_utc" not in st.session_state:
     st.session_state.start_utc = None
 if "end_utc" not in st.session_state:
     st.session_state.end_utc = None
+# Which timeframe button was pressed; windows running up to now are
+# recomputed on Refresh, while "yesterday" has fixed bounds
+if "window_kind" not in st.session_state:
+    st.session_state.window_kind = None
 
 IST = timezone(timedelta(hours=5, minutes=30))
 now_ist = datetime.now(IST)
 
+ROLLING_WINDOW_DAYS = {"7d": 7, "30d": 30}
+
+def window_bounds(kind, now_ist):
+    """UTC (start, end) for a window that runs up to now: "live", "7d" or "30d"."""
+    if kind == "live":
+        # Today's shift so far: from the latest 5 PM IST up to this instant
+        start_ist = now_ist.replace(hour=17, minute=0, second=0, microsecond=0)
+        if now_ist.hour < 17:
+            start_ist -= timedelta(days=1)
+        return start_ist.astimezone(timezone.utc), now_ist.astimezone(timezone.utc)
+    # Rolling windows end on the minute so repeat clicks reuse the cached fetch
+    # instead of producing a new (start, end) key every time
+    end_ist = now_ist.replace(second=0, microsecond=0)
+    start_ist = end_ist - timedelta(days=ROLLING_WINDOW_DAYS[kind])
+    return start_ist.astimezone(timezone.utc), end_ist.astimezone(timezone.utc)
+
 st.header("Select a Report Timeframe")
 show_raw = st.checkbox("Show raw data samples for debugging")
+if st.button("🔄 Refresh data from Twilio"):
+    # Drop the cached fetches and built report so the next run re-pulls
+    _fetch_calls.clear()
+    _fetch_messages.clear()
+    st.session_state.pop("report_cache", None)
+    # Windows running up to now would otherwise re-pull up to the original click
+    if st.session_state.window_kind not in (None, "yesterday"):
+        st.session_state.start_utc, st.session_state.end_utc = window_bounds(st.session_state.window_kind, now_ist)
 st.markdown("---")
 
 col1, col2, col3, col4 = st.columns(4)
@@ -280,21 +498,19 @@ if col1.button("Yesterday's Report", use_container_width=True):
     start_ist = (now_ist.replace(hour=17, minute=0, second=0, microsecond=0) - timedelta(days=1))
     st.session_state.start_utc = start_ist.astimezone(timezone.utc)
     st.session_state.end_utc = (start_ist + timedelta(hours=12)).astimezone(timezone.utc)
+    st.session_state.window_kind = "yesterday"
 
 if col2.button("Today's Report (Live)", use_container_width=True):
-    start_ist = now_ist.replace(hour=17, minute=0, second=0, microsecond=0)
-    if now_ist.hour < 17:
-        start_ist -= timedelta(days=1)
-    st.session_state.start_utc = start_ist.astimezone(timezone.utc)
-    st.session_state.end_utc = now_ist.astimezone(timezone.utc)
+    st.session_state.start_utc, st.session_state.end_utc = window_bounds("live", now_ist)
+    st.session_state.window_kind = "live"
 
 if col3.button("Last 7 Days", use_container_width=True):
-    st.session_state.end_utc = now_ist.astimezone(timezone.utc)
-    st.session_state.start_utc = (now_ist - timedelta(days=7)).astimezone(timezone.utc)
+    st.session_state.start_utc, st.session_state.end_utc = window_bounds("7d", now_ist)
+    st.session_state.window_kind = "7d"
 
 if col4.button("Last 30 Days", use_container_width=True):
-    st.session_state.end_utc = now_ist.astimezone(timezone.utc)
-    st.session_state.start_utc = (now_ist - timedelta(days=30)).astimezone(timezone.utc)
+    st.session_state.start_utc, st.session_state.end_utc = window_bounds("30d", now_ist)
+    st.session_state.window_kind = "30d"
 
 if st.session_state.start_utc and st.session_state.end_utc:
     run_report(st.session_state.start_utc, st.session_state.end_utc, show_raw)